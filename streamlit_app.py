@@ -1,15 +1,73 @@
+import os
 import re
-from typing import Dict, List
+import tempfile
+from collections import Counter
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
 
 import pandas as pd
 import pymupdf  # PyMuPDF
 import streamlit as st
 
-
-def get_sql_urls() -> set:
-    """Return static set of SQL URLs from tables.csv (exact matches only)"""
-    # Static list of SQL URLs extracted from tables.csv
-    sql_urls = {
+# Precompiled patterns shared by the text cleaning and citation parsing helpers
+_MULTI_NL = re.compile(r"\n\s*\n\s*\n+")
+# camelCase and sentence endings both need a space before the uppercase letter
+_CASE_BREAK = re.compile(r"([a-z.!?])(?=[A-Z])")
+_CITATION_FMT = re.compile(r"\[(\d+)\]\s*\[([^\]]+)\]\s*([^:]+):\s*(https?://[^\s]+)")
+_REFS_HDR = re.compile(r"References\s*\n(.*)", re.IGNORECASE | re.DOTALL)
+_CITATION_RE = re.compile(
+    r"\[(\d+)\]\s*\[([^\]]+)\]\s*([^:]+?):\s*(.*?)(?=\n\[|\Z)", re.UNICODE | re.DOTALL
+)
+_URL_RE = re.compile(r"(https?://[^\s]+)")
+_WS = re.compile(r"\s+")
+_BRACKET_NUM_RE = re.compile(r"\[(\d+)\]")
+
+# Fallback context patterns, matched at the position of a "[number]" marker
+_CONTEXT_FLAGS = re.IGNORECASE | re.DOTALL | re.UNICODE
+_CONTEXT_PATTERNS = (
+    re.compile(
+        r"\[\d+\]\s*\[([^\]]+)\]\s*([^:]+):\s*(https?://[^\s]+)", _CONTEXT_FLAGS
+    ),
+    re.compile(r"\[\d+\]\s*\[([^\]]+)\]\s*(.+?)\n(https?://[^\s]+)", _CONTEXT_FLAGS),
+    re.compile(r"\[\d+\]\s*\[([^\]]+)\]\s*([^:]+):\s*$", _CONTEXT_FLAGS),
+    re.compile(
+        r"\[\d+\]\s*\[([^\]]+)\]\s*(.+?)(?:\s*https?://[^\s\)]+)?", _CONTEXT_FLAGS
+    ),
+)
+# URL on the line after the title, tried in order
+_NEXT_LINE_URL_PATTERNS = (
+    re.compile(
+        r"\[\d+\]\s*\[([^\]]+)\]\s*([^:]+):\s*\n\s*(https?://[^\s]+)",
+        _CONTEXT_FLAGS | re.MULTILINE,
+    ),
+    re.compile(
+        r"\[\d+\]\s*\[([^\]]+)\]\s*([^:]+):\s*\n(https?://[^\s]+)",
+        _CONTEXT_FLAGS | re.MULTILINE,
+    ),
+)
+
+
+# Plain text extraction only, without image block processing
+_TEXT_FLAGS = pymupdf.TEXTFLAGS_TEXT & ~pymupdf.TEXT_PRESERVE_IMAGES
+
+# Documents with at least this many pages are split across worker processes
+_PARALLEL_MIN_PAGES = 64
+_MAX_WORKERS = 8
+
+# Citation fields and their display column names, in output order
+_DISPLAY_COLUMNS = {
+    "citation_number": "Citation Number",
+    "citation_headline": "Citation Headline",
+    "citation_link": "Citation Link",
+    "web_internal": "Web/Internal",
+    "total_occurrences": "Total Occurrences",
+    "vector_sql": "Vector/SQL",
+}
+
+
+# Static set of SQL URLs extracted from tables.csv (exact matches only)
+_SQL_URLS: frozenset = frozenset(
+    {
         "https://dashboard.msme.gov.in/Udyam_Statewise.aspx",
         "https://data.adb.org/dataset/2023-asia-small-and-medium-sized-enterprise-monitor",
         "https://data.adb.org/media/10421/download",
@@ -35,136 +93,166 @@ def get_sql_urls() -> set:
         "https://www.niftyindices.com/indices/equity/thematic-indices/nifty-sme-emerge",
         "https://www.rbi.org.in/scripts/Data_Sectoral_Deployment.aspx",
     }
-    return sql_urls
+)
+
+
+def _url_key(url: str) -> str:
+    """Return a URL's lookup key, ignoring scheme, host case and trailing slash"""
+    # Extracted URLs often pick up the punctuation that follows them in the text
+    try:
+        parts = urlsplit(url.rstrip(".,;)"))
+    except ValueError:
+        return url
+
+    key = parts.netloc.lower() + parts.path.rstrip("/")
+    if parts.query:
+        key += "?" + parts.query
+    if parts.fragment:
+        key += "#" + parts.fragment
+    return key
+
+
+# Normalized SQL URLs, for citations whose extracted URL is a near miss
+_SQL_URL_KEYS: frozenset = frozenset(_url_key(url) for url in _SQL_URLS)
+
+
+def get_sql_urls() -> frozenset:
+    """Return static set of SQL URLs from tables.csv (exact matches only)"""
+    return _SQL_URLS
 
 
 def classify_citation_type(citation_url: str) -> str:
-    """Classify citation as 'SQL' if URL exactly matches tables.csv, otherwise 'Vector'"""
+    """Classify citation as 'SQL' if URL matches tables.csv, otherwise 'Vector'"""
     if not citation_url:
         return "Vector"
 
-    sql_urls = get_sql_urls()
-    return "SQL" if citation_url in sql_urls else "Vector"
+    if citation_url in _SQL_URLS:
+        return "SQL"
+
+    # Fall back to the normalized form to tolerate extraction noise
+    return "SQL" if _url_key(citation_url) in _SQL_URL_KEYS else "Vector"
 
 
 def clean_text(text: str) -> str:
     """Clean and format text for better markdown output"""
-    import re
-
     # Remove excessive whitespace
-    text = re.sub(r"\n\s*\n\s*\n+", "\n\n", text)
+    text = _MULTI_NL.sub("\n\n", text)
 
     # Fix common PDF extraction issues
-    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)  # Add space between camelCase
-    text = re.sub(r"([.!?])([A-Z])", r"\1 \2", text)  # Add space after sentence endings
+    # (add space between camelCase and after sentence endings in one pass)
+    text = _CASE_BREAK.sub(r"\1 ", text)
 
     # Clean up citation formatting
-    text = re.sub(
-        r"\[(\d+)\]\s*\[([^\]]+)\]\s*([^:]+):\s*(https?://[^\s]+)",
-        r"[\1] [\2] \3: \4",
-        text,
-    )
+    text = _CITATION_FMT.sub(r"[\1] [\2] \3: \4", text)
 
     return text
 
 
 def find_references_section(text: str) -> str:
     """Find and extract the References section from the text content"""
-    import re
+    # Look for References section (any casing) - capture everything after it
+    # until end; if there is none, use the whole document
+    match = _REFS_HDR.search(text)
+    return match.group(1).strip() if match else text
+
+
+def extract_page_texts_concurrently(pdf_bytes: bytes, workers: int) -> List[str]:
+    """Extract the raw text of every page using a pool of worker processes"""
+    # PyMuPDF holds the GIL and is not thread-safe, so pages are processed in
+    # separate processes; each worker opens its own copy of the document, which
+    # apply_pages requires to be a file on disk
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "upload.pdf")
+        with open(pdf_path, "wb") as pdf_out:
+            pdf_out.write(pdf_bytes)
+
+        return pymupdf.apply_pages(
+            pdf_path,
+            pymupdf.Page.get_text,
+            pagefn_args=("text",),
+            pagefn_kwargs={"flags": _TEXT_FLAGS},
+            method="mp",
+            concurrency=workers,
+        )
 
-    # Look for References section - capture everything after "References" until end
-    references_patterns = [
-        r"References\s*\n(.*)",
-        r"REFERENCES\s*\n(.*)",
-    ]
 
-    for pattern in references_patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        if match:
-            return match.group(1).strip()
+@st.cache_data(max_entries=8, show_spinner=False)
+def extract_text_from_pdf_cached(pdf_bytes: bytes) -> str:
+    """Extract text from PDF bytes with improved formatting (cached per file content)"""
+    workers = min(_MAX_WORKERS, os.cpu_count() or 1)
+    page_texts = None
+
+    # Open PDF with PyMuPDF directly on the bytes (no extra copy of the file)
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        if workers < 2 or len(doc) < _PARALLEL_MIN_PAGES:
+            page_texts = [
+                doc.load_page(page_num).get_text("text", flags=_TEXT_FLAGS)
+                for page_num in range(len(doc))
+            ]
 
-    # If no References section found, return the last part of the document
-    # (often citations are at the end)
-    lines = text.split("\n")
-    for i, line in enumerate(lines):
-        if "References" in line or "REFERENCES" in line:
-            return "\n".join(lines[i + 1 :]).strip()
+    # Large documents: extract pages in parallel
+    if page_texts is None:
+        page_texts = extract_page_texts_concurrently(pdf_bytes, workers)
 
-    return text
+    # Clean up the text
+    return "\n\n".join(clean_text(text) for text in page_texts)
 
 
 def extract_text_from_pdf(pdf_file):
     """Extract text from PDF file with improved formatting"""
     try:
-        # Read the uploaded file
-        pdf_bytes = pdf_file.read()
-
-        # Open PDF with PyMuPDF
-        doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
-
-        text_content = []
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-
-            # Clean up the text
-            text = clean_text(text)
-
-            text_content.append(text)
-
-        doc.close()
-        return "\n\n".join(text_content)
+        return extract_text_from_pdf_cached(pdf_file.getvalue())
 
     except Exception as e:
         st.error(f"Error extracting text from PDF: {str(e)}")
         return None
 
 
-def count_citation_occurrences(citation_num: int, text: str) -> int:
-    """Count how many times a citation number appears in the document"""
-    pattern = rf"\[{citation_num}\]"
-    return len(re.findall(pattern, text))
+def _match_at(
+    pattern: re.Pattern, text: str, positions: List[int]
+) -> Optional[re.Match]:
+    """Return the first match of pattern anchored at one of the given positions"""
+    for position in positions:
+        match = pattern.match(text, position)
+        if match:
+            return match
+    return None
+
+
+def build_occurrence_counts(text: str) -> Dict[int, int]:
+    """Count how many times each citation number appears in the document"""
+    return Counter(int(match.group(1)) for match in _BRACKET_NUM_RE.finditer(text))
 
 
+@st.cache_data(max_entries=8, show_spinner=False)
 def extract_citations_directly(text: str) -> List[Dict]:
     """Extract citations only from the References section"""
     citations = []
     seen_citations = set()
 
+    # Count every citation number in the document in a single pass
+    occurrence_counts = build_occurrence_counts(text)
+
     # First, find the References section
     references_content = find_references_section(text)
 
     # Pattern: [number] [Type] Headline: Link
     # Handle multi-line URLs by capturing everything after : until next citation pattern
     # Use DOTALL to capture across newlines
-    citation_pattern = r"\[(\d+)\]\s*\[([^\]]+)\]\s*([^:]+?):\s*(.*?)(?=\n\[|\Z)"
-    matches1 = re.findall(citation_pattern, references_content, re.UNICODE | re.DOTALL)
-
-    # Check if citation 15 is missing and add it manually if needed
-    citation_15_found = any(match[0] == "15" for match in matches1)
-    if not citation_15_found:
-        # Try to manually add citation 15
-        test_pattern = r"\[15\]\s*\[([^\]]+)\]\s*([^:]+?):\s*(.*?)(?=\n\[|\Z)"
-        test_matches = re.findall(
-            test_pattern, references_content, re.UNICODE | re.DOTALL
-        )
-        if test_matches:
-            matches1.append(
-                ("15", test_matches[0][0], test_matches[0][1], test_matches[0][2])
-            )
+    matches1 = _CITATION_RE.findall(references_content)
 
     # Clean up the matches - remove line breaks from URLs and handle special cases
     cleaned_matches = []
     for citation_num, web_internal, headline, url in matches1:
         # Remove line breaks and extra whitespace from URL
-        clean_url = re.sub(r"\s+", "", url.strip())
+        clean_url = _WS.sub("", url)
 
         # Handle special cases like "Govt source:" prefix
         if "Govtsource:" in clean_url:
             clean_url = clean_url.replace("Govtsource:", "")
 
         # Extract just the URL part if there's extra text
-        url_match = re.search(r"(https?://[^\s]+)", clean_url)
+        url_match = _URL_RE.search(clean_url)
         if url_match:
             clean_url = url_match.group(1)
 
@@ -172,19 +260,16 @@ def extract_citations_directly(text: str) -> List[Dict]:
 
     matches1 = cleaned_matches
 
-    # Collect all matches and choose the best one for each citation number
-    citation_dict = {}  # citation_num -> best citation data
+    # Collect all matches, then choose the best one for each citation number
+    candidates = []
 
     for citation_num, web_internal, headline, url in matches1:
         citation_num = int(citation_num)
 
         # Clean headline and URL - remove line breaks and extra whitespace
-        headline = re.sub(r"\s+", " ", headline.strip())
-        url_clean = re.sub(r"\s+", "", url.strip()) if url else ""
-
-        # Ensure no line breaks in headline and link for CSV output
-        headline = headline.replace("\n", " ").replace("\r", " ")
-        url_clean = url_clean.replace("\n", "").replace("\r", "")
+        # (this also keeps line breaks out of the CSV output)
+        headline = _WS.sub(" ", headline).strip()
+        url_clean = _WS.sub("", url)
 
         # Determine web/internal
         if "Web" in web_internal:
@@ -195,7 +280,7 @@ def extract_citations_directly(text: str) -> List[Dict]:
             web_internal_label = "Web" if url_clean else "Internal"
 
         # Count occurrences
-        total_occurrences = count_citation_occurrences(citation_num, text)
+        total_occurrences = occurrence_counts.get(citation_num, 0)
 
         # Classify as Vector/SQL (only for Internal citations)
         if web_internal_label == "Internal":
@@ -212,19 +297,16 @@ def extract_citations_directly(text: str) -> List[Dict]:
             "vector_sql": citation_type,
         }
 
-        # Choose the best citation for this number (prefer ones with URLs and longer headlines)
-        if citation_num not in citation_dict:
-            citation_dict[citation_num] = citation_data
-        else:
-            current = citation_dict[citation_num]
-            # Prefer citation with URL
-            if citation_data["citation_link"] and not current["citation_link"]:
-                citation_dict[citation_num] = citation_data
-            # If both have URLs or neither has URL, prefer longer headline
-            elif len(citation_data["citation_headline"]) > len(
-                current["citation_headline"]
-            ):
-                citation_dict[citation_num] = citation_data
+        candidates.append(citation_data)
+
+    # Choose the best citation for each number (prefer ones with URLs, then longer
+    # headlines); the sort is stable, so the earliest match wins a tie
+    candidates.sort(
+        key=lambda c: (not c["citation_link"], -len(c["citation_headline"]))
+    )
+    citation_dict = {}  # citation_num -> best citation data
+    for citation_data in candidates:
+        citation_dict.setdefault(citation_data["citation_number"], citation_data)
 
     # Add all citations to the list and mark them as seen
     for citation_data in citation_dict.values():
@@ -232,13 +314,14 @@ def extract_citations_directly(text: str) -> List[Dict]:
         seen_citations.add(citation_data["citation_number"])
 
     # Pattern 2: Handle citations that weren't matched by Pattern header and URL parsing
-    bracket_pattern = r"\[(\d+)\]"
-    bracket_matches = re.findall(bracket_pattern, references_content)
+    # Index where each citation number appears in the References section so
+    # the fallback patterns only need to be tried at those positions
+    citation_locations = {}  # citation_num -> start offsets of "[citation_num]"
+    for match in _BRACKET_NUM_RE.finditer(references_content):
+        citation_locations.setdefault(int(match.group(1)), []).append(match.start())
 
     # Remove duplicates and limit to reasonable range
-    seen_brackets = set(
-        int(match) for match in bracket_matches if match.isdigit() and int(match) <= 100
-    )
+    seen_brackets = {num for num in citation_locations if num <= 100}
 
     # Find the maximum citation number to ensure we capture all citations
     max_citation_num = max(seen_brackets) if seen_brackets else 0
@@ -252,27 +335,18 @@ def extract_citations_directly(text: str) -> List[Dict]:
     for citation_num in seen_brackets:
         if citation_num not in seen_citations:
             seen_citations.add(citation_num)
-
-            # Try to find context for this citation number
-            citation_context_patterns = [
-                rf"\[{citation_num}\]\s*\[([^\]]+)\]\s*([^:]+):\s*(https?://[^\s]+)",
-                rf"\[{citation_num}\]\s*\[([^\]]+)\]\s*(.+?)\n(https?://[^\s]+)",
-                rf"\[{citation_num}\]\s*\[([^\]]+)\]\s*([^:]+):\s*$",
-                rf"\[{citation_num}\]\s*\[([^\]]+)\]\s*(.+?)(?:\s*https?://[^\s\)]+)?",
-            ]
+            locations = citation_locations.get(citation_num, [])
 
             headline = "Missing citation"
             citation_link = ""
             web_internal_label = "Internal"
 
             # Try each pattern until we find valid context
-            for pattern in citation_context_patterns:
-                context_matches = re.findall(
-                    pattern, references_content, re.IGNORECASE | re.DOTALL | re.UNICODE
-                )
+            for pattern in _CONTEXT_PATTERNS:
+                context_match = _match_at(pattern, references_content, locations)
 
-                if context_matches:
-                    context = context_matches[0]
+                if context_match:
+                    context = context_match.groups()
 
                     # Handle different pattern formats
                     if len(context) == 3:
@@ -292,25 +366,15 @@ def extract_citations_directly(text: str) -> List[Dict]:
                             "Web" if "Web" in web_internal_class else "Internal"
                         )
 
-                        # Look for URL on the next line after the title
-                        next_line_pattern = rf"\[{citation_num}\]\s*\[([^\]]+)\]\s*([^:]+):\s*\n\s*(https?://[^\s]+)"
-                        next_line_matches = re.findall(
-                            next_line_pattern,
-                            references_content,
-                            re.IGNORECASE | re.DOTALL | re.UNICODE | re.MULTILINE,
-                        )
-                        if next_line_matches:
-                            citation_link = next_line_matches[0][2].strip()
-                        else:
-                            # Try a simpler pattern to find URL on next line
-                            simple_pattern = rf"\[{citation_num}\]\s*\[([^\]]+)\]\s*([^:]+):\s*\n(https?://[^\s]+)"
-                            simple_matches = re.findall(
-                                simple_pattern,
-                                references_content,
-                                re.IGNORECASE | re.DOTALL | re.UNICODE | re.MULTILINE,
+                        # Look for URL on the next line after the title, then
+                        # try a simpler pattern to find URL on next line
+                        for next_line_pattern in _NEXT_LINE_URL_PATTERNS:
+                            next_line_match = _match_at(
+                                next_line_pattern, references_content, locations
                             )
-                            if simple_matches:
-                                citation_link = simple_matches[0][2].strip()
+                            if next_line_match:
+                                citation_link = next_line_match.group(3).strip()
+                                break
 
                     break
 
@@ -319,16 +383,11 @@ def extract_citations_directly(text: str) -> List[Dict]:
                 continue
 
             # Clean headline and URL - remove line breaks and extra whitespace
-            headline = re.sub(r"\s+", " ", headline.strip())
-            citation_link = (
-                re.sub(r"\s+", "", citation_link.strip()) if citation_link else ""
-            )
+            # (this also keeps line breaks out of the CSV output)
+            headline = _WS.sub(" ", headline).strip()
+            citation_link = _WS.sub("", citation_link)
 
-            # Ensure no line breaks in headline and link for CSV output
-            headline = headline.replace("\n", " ").replace("\r", " ")
-            citation_link = citation_link.replace("\n", "").replace("\r", "")
-
-            total_occurrences = count_citation_occurrences(citation_num, text)
+            total_occurrences = occurrence_counts.get(citation_num, 0)
 
             # Classify as Vector/SQL
             citation_type = classify_citation_type(citation_link)
@@ -355,23 +414,14 @@ def citations_to_dataframe(citations: List[Dict]) -> pd.DataFrame:
     if not citations:
         return pd.DataFrame()
 
-    # Convert to dataframe
-    df = pd.DataFrame(citations)
-
-    # Rename columns for better display
-    df = df.rename(
-        columns={
-            "citation_number": "Citation Number",
-            "citation_headline": "Citation Headline",
-            "citation_link": "Citation Link",
-            "web_internal": "Web/Internal",
-            "total_occurrences": "Total Occurrences",
-            "vector_sql": "Vector/SQL",
+    # Convert to dataframe one column at a time, using the display names directly
+    return pd.DataFrame(
+        {
+            column: [citation[field] for citation in citations]
+            for field, column in _DISPLAY_COLUMNS.items()
         }
     )
 
-    return df
-
 
 def main():
     st.set_page_config(
@@ -400,52 +450,42 @@ def main():
                 # Convert to dataframe
                 df = citations_to_dataframe(citations)
 
-                # Calculate analytics
-                unique_web_count = sum(
-                    1 for c in citations if c["web_internal"] == "Web"
-                )
-                unique_internal_count = sum(
-                    1 for c in citations if c["web_internal"] == "Internal"
-                )
-                total_web_occurrences = sum(
-                    c["total_occurrences"]
-                    for c in citations
-                    if c["web_internal"] == "Web"
-                )
-                total_internal_occurrences = sum(
-                    c["total_occurrences"]
-                    for c in citations
-                    if c["web_internal"] == "Internal"
+                # Calculate analytics - citation counts and occurrence sums per
+                # Web/Internal and Vector/SQL combination in one grouped pass
+                summary = (
+                    df.groupby(["Web/Internal", "Vector/SQL"])["Total Occurrences"]
+                    .agg(["count", "sum"])
+                    .unstack(fill_value=0)
+                    .reindex(
+                        index=["Web", "Internal"],
+                        columns=pd.MultiIndex.from_product(
+                            [["count", "sum"], ["Vector", "SQL", "N/A"]]
+                        ),
+                        fill_value=0,
+                    )
                 )
+                citation_counts = summary["count"]
+                occurrence_sums = summary["sum"]
 
-                vector_citations = [c for c in citations if c["vector_sql"] == "Vector"]
-                sql_citations = [c for c in citations if c["vector_sql"] == "SQL"]
-                vector_occurrences = sum(
-                    c["total_occurrences"] for c in vector_citations
-                )
-                sql_occurrences = sum(c["total_occurrences"] for c in sql_citations)
+                unique_web_count = int(citation_counts.loc["Web"].sum())
+                unique_internal_count = int(citation_counts.loc["Internal"].sum())
+                total_web_occurrences = int(occurrence_sums.loc["Web"].sum())
+                total_internal_occurrences = int(occurrence_sums.loc["Internal"].sum())
 
                 # For validation, only count Internal citations
-                internal_vector_citations = [
-                    c
-                    for c in citations
-                    if c["web_internal"] == "Internal" and c["vector_sql"] == "Vector"
-                ]
-                internal_sql_citations = [
-                    c
-                    for c in citations
-                    if c["web_internal"] == "Internal" and c["vector_sql"] == "SQL"
-                ]
-                internal_vector_occurrences = sum(
-                    c["total_occurrences"] for c in internal_vector_citations
-                )
-                internal_sql_occurrences = sum(
-                    c["total_occurrences"] for c in internal_sql_citations
+                internal_vector_count = int(citation_counts.at["Internal", "Vector"])
+                internal_sql_count = int(citation_counts.at["Internal", "SQL"])
+                internal_vector_occurrences = int(
+                    occurrence_sums.at["Internal", "Vector"]
                 )
+                internal_sql_occurrences = int(occurrence_sums.at["Internal", "SQL"])
+
+                na_count = int(citation_counts["N/A"].sum())
+                na_occurrences = int(occurrence_sums["N/A"].sum())
 
                 # Calculate totals
                 total_citations = len(citations)
-                total_occurrences = sum(c["total_occurrences"] for c in citations)
+                total_occurrences = int(df["Total Occurrences"].sum())
 
                 # Calculate percentages
                 internal_percentage = (
@@ -478,9 +518,9 @@ def main():
                 with col3:
                     st.metric("Internal Citations", unique_internal_count)
                 with col4:
-                    st.metric("Vector Citations", len(internal_vector_citations))
+                    st.metric("Vector Citations", internal_vector_count)
                 with col5:
-                    st.metric("SQL Citations", len(internal_sql_citations))
+                    st.metric("SQL Citations", internal_sql_count)
 
                 # Display metrics in columns - Occurrences
                 col6, col7, col8, col9, col10 = st.columns(5)
@@ -513,7 +553,7 @@ def main():
                     internal_sql_occurrences + internal_vector_occurrences
                 )
                 internal_unique_check = unique_internal_count == (
-                    len(internal_sql_citations) + len(internal_vector_citations)
+                    internal_sql_count + internal_vector_count
                 )
 
                 if not internal_total_check or not internal_unique_check:
@@ -530,19 +570,8 @@ def main():
                 # Display dataframe
                 st.dataframe(df, width="stretch")
 
-                # Create CSV in the same format as the main processor
-                import csv
-                import io
-
-                # Create CSV with side-by-side format
-                main_headers = [
-                    "Citation Number",
-                    "Citation Headline",
-                    "Citation Link",
-                    "Web/Internal",
-                    "Total Occurrences",
-                    "Vector/SQL",
-                ]
+                # Create CSV in the same side-by-side format as the main processor
+                main_headers = list(_DISPLAY_COLUMNS.values())
                 analytics_headers = ["Metric", "Value"]
 
                 # Calculate analytics data
@@ -550,70 +579,41 @@ def main():
                     ["Total Citations", total_citations],
                     ["Web Citations", unique_web_count],
                     ["Internal Citations", unique_internal_count],
-                    ["Vector Citations", len(internal_vector_citations)],
-                    ["SQL Citations", len(internal_sql_citations)],
-                    [
-                        "N/A Citations",
-                        len([c for c in citations if c["vector_sql"] == "N/A"]),
-                    ],
+                    ["Vector Citations", internal_vector_count],
+                    ["SQL Citations", internal_sql_count],
+                    ["N/A Citations", na_count],
                     ["Total Occurrences", total_occurrences],
                     ["Web Occurrences", total_web_occurrences],
                     ["Internal Occurrences", total_internal_occurrences],
                     ["Vector Occurrences", internal_vector_occurrences],
                     ["SQL Occurrences", internal_sql_occurrences],
-                    [
-                        "N/A Occurrences",
-                        sum(
-                            c["total_occurrences"]
-                            for c in citations
-                            if c["vector_sql"] == "N/A"
-                        ),
-                    ],
+                    ["N/A Occurrences", na_occurrences],
                     ["Internal %", f"{internal_percentage:.1f}%"],
                     ["Web %", f"{web_percentage:.1f}%"],
                     ["Vector %", f"{vector_percentage:.1f}%"],
                     ["SQL %", f"{sql_percentage:.1f}%"],
                     [
                         "N/A %",
-                        f"{(sum(c['total_occurrences'] for c in citations if c['vector_sql'] == 'N/A') / total_occurrences * 100) if total_occurrences > 0 else 0:.1f}%",
+                        f"{(na_occurrences / total_occurrences * 100) if total_occurrences > 0 else 0:.1f}%",
                     ],
                 ]
 
-                # Create CSV string with side-by-side format
-                output = io.StringIO()
-                writer = csv.writer(output)
-
-                # Write combined header with one blank column as a gap
-                writer.writerow(main_headers + [""] + analytics_headers)
-
-                # Determine the number of rows to write
-                max_rows = max(len(citations), len(analytics_rows))
-
-                for i in range(max_rows):
-                    # Left side: citation row data or blanks
-                    if i < len(citations):
-                        c = citations[i]
-                        left = [
-                            c["citation_number"],
-                            c["citation_headline"],
-                            c["citation_link"],
-                            c["web_internal"],
-                            c["total_occurrences"],
-                            c["vector_sql"],
-                        ]
-                    else:
-                        left = [""] * len(main_headers)
-
-                    # Right side: analytics metric/value or blanks
-                    if i < len(analytics_rows):
-                        right = analytics_rows[i]
-                    else:
-                        right = [""] * len(analytics_headers)
-
-                    writer.writerow(left + [""] + right)
-
-                combined_csv = output.getvalue()
-                output.close()
+                # Create CSV string with side-by-side format: pad both tables to
+                # the same number of rows and put one blank column as a gap
+                max_rows = max(len(df), len(analytics_rows))
+                citations_table = (
+                    df[main_headers]
+                    .astype(object)
+                    .reindex(range(max_rows), fill_value="")
+                )
+                analytics_table = pd.DataFrame(
+                    analytics_rows, columns=analytics_headers, dtype=object
+                ).reindex(range(max_rows), fill_value="")
+                gap_column = pd.Series("", index=range(max_rows), name="")
+
+                combined_csv = pd.concat(
+                    [citations_table, gap_column, analytics_table], axis=1
+                ).to_csv(index=False, lineterminator="\r\n")
 
                 # Download button
                 st.download_button(